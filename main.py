@@ -1,6 +1,25 @@
+# Nicole - Admin Dashboard
+#
+# Database setup: run these scripts in the Supabase SQL editor before starting the app,
+# and again after they change. Each is safe to re-run; apply them in this order:
+#   1. sql/contacts_search_haystack.sql - search column and index for the Users page search
+#   2. sql/dashboard_stats.sql          - counts for the Overview page and Users filters
+#   3. sql/status_daily.sql             - per-day counts for the Analytics page
+#   4. sql/contacts_realtime.sql        - publishes contacts changes to the realtime listener
+# A page whose script is missing stops with an error naming it. Without 4 the listener never
+# goes live and cached data is polled instead.
+
 import streamlit as st
 import pandas as pd
-from supabase import create_client, Client
+import numpy as np
+import asyncio
+import copy
+import logging
+import math
+import threading
+import time
+from supabase import create_client, acreate_client, Client, PostgrestAPIError
+from realtime import RealtimeSubscribeStates
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
@@ -8,6 +27,8 @@ import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
 
+logger = logging.getLogger(__name__)
+
 # =====================================================
 # CONFIGURATION
 # =====================================================
@@ -23,37 +44,42 @@ st.set_page_config(
 # AUTHENTICATION
 # =====================================================
 
-# Load authentication config from Streamlit secrets (production) or YAML file (local)
-try:
-    # Production: Manually build config from Streamlit secrets
-    config = {
-        'credentials': {
-            'usernames': {
-                username: {
-                    'email': st.secrets['credentials']['usernames'][username]['email'],
-                    'name': st.secrets['credentials']['usernames'][username]['name'],
-                    'password': st.secrets['credentials']['usernames'][username]['password']
+@st.cache_resource
+def load_auth_config():
+    """Load authentication config from Streamlit secrets (production) or YAML file (local)"""
+    try:
+        # Production: Manually build config from Streamlit secrets
+        return {
+            'credentials': {
+                'usernames': {
+                    username: {
+                        'email': st.secrets['credentials']['usernames'][username]['email'],
+                        'name': st.secrets['credentials']['usernames'][username]['name'],
+                        'password': st.secrets['credentials']['usernames'][username]['password']
+                    }
+                    for username in st.secrets['credentials']['usernames']
                 }
-                for username in st.secrets['credentials']['usernames']
+            },
+            'cookie': {
+                'name': st.secrets['cookie']['name'],
+                'key': st.secrets['cookie']['key'],
+                'expiry_days': st.secrets['cookie']['expiry_days']
+            },
+            'preauthorized': {
+                'emails': list(st.secrets.get('preauthorized', {}).get('emails', []))
             }
-        },
-        'cookie': {
-            'name': st.secrets['cookie']['name'],
-            'key': st.secrets['cookie']['key'],
-            'expiry_days': st.secrets['cookie']['expiry_days']
-        },
-        'preauthorized': {
-            'emails': list(st.secrets.get('preauthorized', {}).get('emails', []))
         }
-    }
-except:
-    # Local development: Load from YAML file
-    with open('auth_config.yaml') as file:
-        config = yaml.load(file, Loader=SafeLoader)
-        
-# Create authenticator object
+    except Exception:
+        # Local development: Load from YAML file
+        with open('auth_config.yaml') as file:
+            return yaml.load(file, Loader=SafeLoader)
+
+config = load_auth_config()
+
+# Create authenticator object - the authenticator writes login state into the
+# credentials dict, so it gets its own copy rather than the shared cached one
 authenticator = stauth.Authenticate(
-    config['credentials'],
+    copy.deepcopy(config['credentials']),
     config['cookie']['name'],
     config['cookie']['key'],
     config['cookie']['expiry_days']
@@ -90,14 +116,16 @@ with st.sidebar:
 # SUPABASE CONNECTION
 # =====================================================
 
-# Get credentials from Streamlit secrets (production) or set manually (local)
-try:
-    SUPABASE_URL = st.secrets["SUPABASE_URL"]
-    SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-except:
-    # For local development, replace these with your actual credentials
-    SUPABASE_URL = "YOUR_SUPABASE_URL"
-    SUPABASE_KEY = "YOUR_SUPABASE_KEY"
+@st.cache_resource
+def load_supabase_secrets():
+    """Get credentials from Streamlit secrets (production) or set manually (local)"""
+    try:
+        return st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]
+    except Exception:
+        # For local development, replace these with your actual credentials
+        return "YOUR_SUPABASE_URL", "YOUR_SUPABASE_KEY"
+
+SUPABASE_URL, SUPABASE_KEY = load_supabase_secrets()
 
 @st.cache_resource
 def init_supabase() -> Client:
@@ -110,32 +138,279 @@ supabase = init_supabase()
 # DATA FUNCTIONS
 # =====================================================
 
-@st.cache_data(ttl=60)
-def get_all_contacts():
-    """Get all contacts from Supabase"""
-    response = supabase.table('contacts').select('*').order('created_at', desc=True).execute()
+# Columns the dashboard actually renders - avoids shipping the whole row
+CONTACT_COLUMNS = 'id,first_name,email,phone,status,current_day,created_at,consent_whatsapp,consent_email'
+
+STATUSES = ['lead_new', 'challenge_running', 'challenge_completed', 'paid_member']
+
+# Status badge shown next to each user
+STATUS_EMOJI = {
+    'lead_new': '🔵',
+    'challenge_running': '🟢',
+    'challenge_completed': '🟡',
+    'paid_member': '👑'
+}
+
+# Users page table: every column is shown, only status and current_day are editable
+EDITOR_COLUMNS = ['status_emoji', 'id', 'first_name', 'email', 'phone', 'status', 'current_day', 'created_at', 'consent_whatsapp', 'consent_email']
+# Only these are written back - other columns may have changed since the page was loaded
+UPDATE_COLUMNS = ['id', 'status', 'current_day']
+USERS_PAGE_SIZE = 50
+
+# Explicit dtypes so frames convert to Arrow (cache, data_editor) without per-object inference
+CONTACT_DTYPES = {
+    'first_name': pd.StringDtype('pyarrow'),
+    'email': pd.StringDtype('pyarrow'),
+    'phone': pd.StringDtype('pyarrow'),
+    'consent_whatsapp': pd.BooleanDtype(),
+    'consent_email': pd.BooleanDtype(),
+    'created_at': 'datetime64[ns, UTC]'
+}
+
+def map_status_emoji(status):
+    """Map a status Series to badges, with a neutral badge for unknown statuses"""
+    # Categorical map only touches the categories; object dtype lets fillna add the fallback
+    return status.map(STATUS_EMOJI).astype(object).fillna('⚪')
+
+def prepare_contacts(df):
+    """Parse dates, fix dtypes and map status badges once so cached frames are ready to render"""
+    # Loaders select different columns, so each step only runs when its column was fetched
+    if not df.empty:
+        if 'created_at' in df.columns:
+            df['created_at'] = pd.to_datetime(df['created_at'], utc=True, format='ISO8601')
+        df = df.astype({col: dtype for col, dtype in CONTACT_DTYPES.items() if col in df.columns})
+        if 'created_at' in df.columns:
+            df['date'] = df['created_at'].dt.date
+        if 'status' in df.columns:
+            # Stored as integer codes, so isin/value_counts/groupby on status skip string compares.
+            # Statuses outside STATUSES get their own categories rather than becoming NaN.
+            unknown = sorted(set(df['status'].dropna()) - set(STATUSES))
+            df['status'] = df['status'].astype(pd.CategoricalDtype(STATUSES + unknown))
+            df['status_emoji'] = map_status_emoji(df['status'])
+        if 'current_day' in df.columns:
+            df['current_day'] = pd.to_numeric(df['current_day'], downcast='integer')
+    return df
+
+# Seconds the page queries stay cached. While the realtime listener is subscribed change events
+# clear them, and the longer age only catches missed events; otherwise they are polled.
+CONTACTS_MAX_AGE = 60
+CONTACTS_LIVE_MAX_AGE = 600
+
+@st.cache_resource
+def get_cache_state():
+    """Process-wide realtime status and when the page caches were last cleared, shared by every session"""
+    return {'live': False, 'cleared_at': time.time()}
+
+# PostgREST/Postgres error codes for a function or column that doesn't exist
+MISSING_SCHEMA_CODES = ('PGRST202', '42883', '42703')
+
+def execute_with_setup(query, script):
+    """Execute a query that needs a sql/ script, stopping the page with a pointer to the script if it wasn't applied"""
+    try:
+        return query.execute()
+    except PostgrestAPIError as e:
+        if e.code not in MISSING_SCHEMA_CODES:
+            raise
+        st.error(f"Database setup missing - run sql/{script} in the Supabase SQL editor ({e.message})")
+        st.stop()
+
+def clear_page_caches(state):
+    """Clear the cached per-page queries after the contacts table changed"""
+    get_stats_agg.clear()
+    get_latest_signups.clear()
+    get_completing_today.clear()
+    get_users_page.clear()
+    get_analytics_data.clear()
+    get_row_count.clear()
+    get_contacts_csv.clear()
+    state['cleared_at'] = time.time()
+
+def expire_page_caches():
+    """Clear the page caches every CONTACTS_MAX_AGE seconds while no realtime events arrive"""
+    state = get_cache_state()
+    if not state['live'] and time.time() - state['cleared_at'] > CONTACTS_MAX_AGE:
+        clear_page_caches(state)
+
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_stats_agg():
+    """Get contact counts by status, by challenge day and by signup date (see sql/dashboard_stats.sql)"""
+    data = execute_with_setup(supabase.rpc('dashboard_stats'), 'dashboard_stats.sql').data
+    by_status = pd.DataFrame(data['by_status'], columns=['status', 'count'])
+    by_day = pd.DataFrame(data['by_day'], columns=['current_day', 'count'])
+    by_date = pd.DataFrame(data['by_date'], columns=['signup_date', 'count'])
+    by_date['signup_date'] = pd.to_datetime(by_date['signup_date'], format='ISO8601').dt.date
+    return {
+        'status_counts': by_status.set_index('status')['count'],
+        'day_counts': by_day.set_index('current_day')['count'].sort_index(),
+        'daily_signups': by_date.set_index('signup_date')['count'].sort_index()
+    }
+
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_latest_signups(limit=5):
+    """Get the most recent signups"""
+    response = (
+        supabase.table('contacts')
+        .select('first_name,email,status,created_at')
+        .order('created_at', desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return prepare_contacts(pd.DataFrame(response.data))
+
+# Day of the challenge on which a running user completes it
+COMPLETION_DAY = 8
+
+@st.cache_data(ttl=300)
+def get_completing_today(limit=5):
+    """Get users on the final day of a running challenge"""
+    response = (
+        supabase.table('contacts')
+        .select('first_name,email')
+        .eq('current_day', COMPLETION_DAY)
+        .eq('status', 'challenge_running')
+        .limit(limit)
+        .execute()
+    )
     return pd.DataFrame(response.data)
 
-def update_contact(contact_id, updates):
-    """Update a contact in Supabase"""
-    response = supabase.table('contacts').update(updates).eq('id', contact_id).execute()
-    return response
+def get_overview_data():
+    """Get what the Overview page renders: the stats aggregates, latest signups and today's completers"""
+    return get_stats_agg(), get_latest_signups(), get_completing_today()
+
+def filter_in(query, column, values):
+    """Keep rows whose column is one of values - None in values matches NULL"""
+    known = [value for value in values if value is not None]
+    if len(known) == len(values):
+        return query.in_(column, known)
+    if not known:
+        return query.is_(column, 'null')
+    quoted = ','.join(f'"{value}"' for value in known)
+    return query.or_(f'{column}.is.null,{column}.in.({quoted})')
+
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_users_page(status_filter, day_filter, search, page, page_size=USERS_PAGE_SIZE):
+    """Get one page of contacts matching the Users page filters, plus the total match count"""
+    # A filter of None (or an empty one) doesn't restrict that column
+    query = supabase.table('contacts').select(CONTACT_COLUMNS, count='exact')
+    if status_filter:
+        query = filter_in(query, 'status', status_filter)
+    if day_filter:
+        query = filter_in(query, 'current_day', day_filter)
+    if search:
+        # search_haystack is lowercased name/email/phone (see sql/contacts_search_haystack.sql);
+        # escape LIKE wildcards so the term matches literally. PostgREST also reads '*' as '%'
+        # and can't escape it, so it is dropped from the term.
+        term = search.lower().replace('*', '').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.like('search_haystack', f'%{term}%')
+    response = execute_with_setup(
+        query.order('created_at', desc=True).range(page * page_size, (page + 1) * page_size - 1),
+        'contacts_search_haystack.sql'
+    )
+    return prepare_contacts(pd.DataFrame(response.data)), response.count or 0
+
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_analytics_data(start_date, end_date):
+    """Get per-status signup counts for each day between two dates (inclusive, UTC) and the average current_day (see sql/status_daily.sql)"""
+    data = execute_with_setup(supabase.rpc('status_daily', {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
+    }), 'status_daily.sql').data
+    status_daily = pd.DataFrame(data['by_date'], columns=['date', 'status', 'count'])
+    status_daily['date'] = pd.to_datetime(status_daily['date'], format='ISO8601').dt.date
+    return {
+        'status_daily': status_daily,
+        'avg_current_day': data['avg_current_day']
+    }
 
-def delete_contact(contact_id):
-    """Delete a contact from Supabase"""
-    response = supabase.table('contacts').delete().eq('id', contact_id).execute()
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_row_count():
+    """Count contacts without transferring any rows"""
+    response = supabase.table('contacts').select('id', count='exact', head=True).execute()
+    return response.count or 0
+
+@st.cache_resource
+def start_contacts_listener():
+    """Subscribe once per process to contacts changes and clear the cached queries on each event"""
+    # Looked up here rather than in the callbacks, which run outside the script thread
+    state = get_cache_state()
+    
+    def on_change(payload):
+        clear_page_caches(state)
+    
+    def on_subscribe(subscribe_state, error):
+        # Events only arrive once the server confirms the subscription (see sql/contacts_realtime.sql)
+        state['live'] = subscribe_state == RealtimeSubscribeStates.SUBSCRIBED
+        if not state['live']:
+            logger.warning("Realtime subscription to contacts %s: %s", subscribe_state.value, error)
+    
+    async def listen():
+        client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        await client.realtime.connect()
+        await (
+            client.realtime.channel('contacts')
+            .on_postgres_changes('*', schema='public', table='contacts', callback=on_change)
+            .subscribe(on_subscribe)
+        )
+        await client.realtime.listen()
+    
+    def run():
+        try:
+            asyncio.run(listen())
+        except Exception:
+            logger.exception("Realtime listener stopped")
+        finally:
+            # Fall back to CONTACTS_MAX_AGE polling
+            state['live'] = False
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+start_contacts_listener()
+expire_page_caches()
+
+def bulk_update_contacts(rows):
+    """Update status and current_day of many contacts, one request per distinct (status, day) pair"""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['status'], row['current_day']), []).append(row['id'])
+    
+    for (status, current_day), ids in groups.items():
+        (
+            supabase.table('contacts')
+            .update({'status': status, 'current_day': current_day})
+            .in_('id', ids)
+            .execute()
+        )
+    # Cleared after the write so a rerun in between can't cache the old rows again
+    clear_page_caches(get_cache_state())
+
+def bulk_delete_contacts(ids):
+    """Delete many contacts from Supabase with a single request"""
+    response = supabase.table('contacts').delete().in_('id', ids).execute()
+    clear_page_caches(get_cache_state())
     return response
 
+def get_all_contacts():
+    """Fetch all contacts from Supabase - only the CSV export needs the whole table"""
+    response = supabase.table('contacts').select(CONTACT_COLUMNS).order('created_at', desc=True).execute()
+    return prepare_contacts(pd.DataFrame(response.data))
+
+@st.cache_data(ttl=CONTACTS_LIVE_MAX_AGE)
+def get_contacts_csv():
+    """Get the CSV export of all contacts - only the bytes are cached, not the frame"""
+    return get_all_contacts().reindex(columns=CONTACT_COLUMNS.split(',')).to_csv(index=False).encode('utf-8')
+
 # =====================================================
 # HELPER FUNCTIONS
 # =====================================================
 
-def get_stats(df):
-    """Calculate dashboard statistics"""
-    total_users = len(df)
-    active_challenges = len(df[df['status'] == 'challenge_running'])
-    completed_challenges = len(df[df['status'] == 'challenge_completed'])
-    paid_users = len(df[df['status'] == 'paid_member']) if 'status' in df.columns else 0
+def get_stats(status_counts):
+    """Calculate dashboard statistics from per-status user counts"""
+    total_users = int(status_counts.sum())
+    active_challenges = int(status_counts.get('challenge_running', 0))
+    completed_challenges = int(status_counts.get('challenge_completed', 0))
+    paid_users = int(status_counts.get('paid_member', 0))
     
     # Calculate revenue (assuming €9.99 per paid user)
     revenue = paid_users * 9.99
@@ -152,15 +427,186 @@ def get_stats(df):
         'conversion_rate': conversion_rate
     }
 
-def status_color(status):
-    """Return color for status badge"""
-    colors = {
-        'lead_new': '🔵',
-        'challenge_running': '🟢',
-        'challenge_completed': '🟡',
-        'paid_member': '👑'
+def downsample_lttb(x, y, n_out=500):
+    """Downsample a series to n_out points with Largest-Triangle-Three-Buckets"""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return x, y
+    
+    # LTTB needs numeric x values to measure triangle areas
+    if np.issubdtype(x.dtype, np.number):
+        x_num = x.astype(float)
+    else:
+        x_num = pd.to_datetime(x).to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+    
+    # First and last points are always kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2]
+        avg_x = x_num[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        
+        # Pick the point forming the largest triangle with the previous pick and the next bucket's average
+        area = np.abs(
+            (x_num[a] - avg_x) * (y[start:end] - y[a])
+            - (x_num[a] - x_num[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    
+    return x[keep], y[keep]
+
+# =====================================================
+# PAGE COMPONENTS
+# =====================================================
+
+def status_chart(status_counts):
+    """Pie chart of users by status"""
+    known_counts = status_counts[status_counts.index.notna()].sort_values(ascending=False)
+    fig = px.pie(
+        values=known_counts.values,
+        names=known_counts.index,
+        title="Users by Status",
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    st.plotly_chart(fig, width='stretch')
+
+def day_chart(day_counts):
+    """Bar chart of users by challenge day"""
+    day_counts = day_counts[day_counts.index.notna()]
+    fig = px.bar(
+        x=day_counts.index,
+        y=day_counts.values,
+        labels={'x': 'Day', 'y': 'Number of Users'},
+        title="Users by Challenge Day"
+    )
+    st.plotly_chart(fig, width='stretch')
+
+def signups_chart(daily_signups):
+    """Downsampled line chart of daily signups"""
+    x, y = downsample_lttb(daily_signups.index, daily_signups.values)
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines+markers', name='signups'))
+    fig.update_layout(title="Daily Signups", xaxis_title='date', yaxis_title='signups')
+    st.plotly_chart(fig, width='stretch')
+
+def funnel_chart(stats):
+    """Funnel from signup to paid membership"""
+    funnel_data = {
+        'Stage': ['Signups', 'Active', 'Completed', 'Paid'],
+        'Count': [
+            stats['total_users'],
+            stats['active_challenges'],
+            stats['completed_challenges'],
+            stats['paid_users']
+        ]
     }
-    return colors.get(status, '⚪')
+    fig = go.Figure(go.Funnel(
+        y=funnel_data['Stage'],
+        x=funnel_data['Count'],
+        textinfo="value+percent initial"
+    ))
+    fig.update_layout(title="User Journey Funnel")
+    st.plotly_chart(fig, width='stretch')
+
+def daily_trend_chart(status_daily):
+    """Area chart of signups per day in the selected range"""
+    daily = status_daily.groupby('date')['count'].sum().reset_index(name='count')
+    fig = px.area(
+        daily,
+        x='date',
+        y='count',
+        title="Signups per Day"
+    )
+    st.plotly_chart(fig, width='stretch')
+
+def status_trend_chart(status_daily):
+    """Downsampled per-status signup lines in the selected range"""
+    fig = go.Figure()
+    # The date inputs bound the x range, so each status is resampled for that window only
+    for status, group in status_daily.groupby('status', sort=False):
+        x, y = downsample_lttb(group['date'], group['count'])
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=status))
+    fig.update_layout(title="Status Distribution Over Time", xaxis_title='date', yaxis_title='count')
+    st.plotly_chart(fig, width='stretch')
+
+@st.fragment
+def render_users_table(status_filter, day_filter, search):
+    """Editable page of users - paging and saving rerun only this fragment"""
+    page_number = st.session_state.get('users_page', 1)
+    # Right after a save the saved rows are shown as they are, instead of refetching the page
+    saved_page = st.session_state.pop('users_saved_page', None)
+    if saved_page is not None:
+        page_df, total = saved_page
+    else:
+        page_df, total = get_users_page(status_filter, day_filter, search, page_number - 1)
+    page_count = max(1, math.ceil(total / USERS_PAGE_SIZE))
+    if page_number > page_count:
+        # Saves and other sessions' deletes can shrink the result below the selected page
+        page_number = page_count
+        st.session_state['users_page'] = page_number
+        page_df, total = get_users_page(status_filter, day_filter, search, page_number - 1)
+    
+    st.number_input("Page", min_value=1, max_value=page_count, step=1, key='users_page')
+    st.markdown(f"**Showing {len(page_df)} of {total} users - page {page_number} of {page_count}**")
+    
+    if page_df.empty:
+        st.info("No users on this page")
+    else:
+        # Edit users inline - one widget for the whole table instead of one form per row
+        view = page_df[EDITOR_COLUMNS]
+        edited = st.data_editor(
+            view,
+            column_config={
+                'status_emoji': st.column_config.TextColumn(""),
+                'status': st.column_config.SelectboxColumn("Status", options=STATUSES, required=True),
+                'current_day': st.column_config.NumberColumn("Current Day", min_value=0, max_value=30, step=1, required=True)
+            },
+            disabled=[col for col in EDITOR_COLUMNS if col not in ('status', 'current_day')],
+            hide_index=True,
+            num_rows='dynamic',
+            key='users_editor'
+        )
+        
+        # Diff the editor against the loaded rows
+        removed_ids = view.loc[view.index.difference(edited.index), 'id'].tolist()
+        kept = view.index.intersection(edited.index)
+        # Compare as objects - the editor may hand back status with different categories
+        before = view.loc[kept, ['status', 'current_day']].astype(object)
+        after = edited.loc[kept, ['status', 'current_day']].astype(object)
+        changed = (before.ne(after) & ~(before.isna() & after.isna())).any(axis=1)
+        changed_rows = (
+            edited.loc[changed[changed].index, UPDATE_COLUMNS]
+            .astype(object)
+            .where(lambda d: d.notna(), None)
+            .to_dict('records')
+        )
+        
+        if edited['id'].isna().any():
+            st.warning("New users can't be added here - added rows are ignored")
+        
+        st.caption(f"{len(changed_rows)} changed, {len(removed_ids)} to delete")
+        if st.button("💾 Save Changes", disabled=not (changed_rows or removed_ids)):
+            if changed_rows:
+                bulk_update_contacts(changed_rows)
+            if removed_ids:
+                bulk_delete_contacts(removed_ids)
+            st.success("Updated!")
+            # The writes succeeded, so the edited rows are what Supabase now holds for this page.
+            # Rows moved out of the filter by the edit stay until the page is next loaded.
+            saved = edited[edited['id'].notna()].reset_index(drop=True)
+            saved['status_emoji'] = map_status_emoji(saved['status'])
+            st.session_state['users_saved_page'] = (saved, total - len(removed_ids))
+            # Drop the pending edits so they aren't replayed onto the saved rows
+            st.session_state.pop('users_editor', None)
+            st.rerun(scope="fragment")
 
 # =====================================================
 # MAIN APP
@@ -181,15 +627,14 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### Quick Actions")
     if st.button("🔄 Refresh Data"):
-        st.cache_data.clear()
+        clear_page_caches(get_cache_state())
         st.rerun()
     
+    # Behind a button so that opening a page doesn't load the full table just for the export
     if st.button("📥 Export All Data"):
-        df = get_all_contacts()
-        csv = df.to_csv(index=False)
         st.download_button(
             label="Download CSV",
-            data=csv,
+            data=get_contacts_csv(),
             file_name=f"nicole_contacts_{datetime.now().strftime('%Y%m%d')}.csv",
             mime="text/csv"
         )
@@ -202,12 +647,13 @@ if page == "📊 Overview":
     st.header("📊 Dashboard Overview")
     
     # Load data
-    df = get_all_contacts()
+    agg, recent, today_completers = get_overview_data()
     
-    if df.empty:
+    if agg['status_counts'].empty:
         st.warning("No contacts found in database.")
     else:
-        stats = get_stats(df)
+        status_counts = agg['status_counts']
+        stats = get_stats(status_counts)
         
         # Stats Cards
         col1, col2, col3 = st.columns(3)
@@ -237,27 +683,11 @@ if page == "📊 Overview":
         
         with col1:
             st.subheader("📊 Status Distribution")
-            if 'status' in df.columns:
-                status_counts = df['status'].value_counts()
-                fig = px.pie(
-                    values=status_counts.values,
-                    names=status_counts.index,
-                    title="Users by Status",
-                    color_discrete_sequence=px.colors.qualitative.Set3
-                )
-                st.plotly_chart(fig, width='stretch')
+            status_chart(status_counts)
         
         with col2:
             st.subheader("📅 Current Day Distribution")
-            if 'current_day' in df.columns:
-                day_counts = df['current_day'].value_counts().sort_index()
-                fig = px.bar(
-                    x=day_counts.index,
-                    y=day_counts.values,
-                    labels={'x': 'Day', 'y': 'Number of Users'},
-                    title="Users by Challenge Day"
-                )
-                st.plotly_chart(fig, width='stretch')
+            day_chart(agg['day_counts'])
         
         st.markdown("---")
         
@@ -266,36 +696,11 @@ if page == "📊 Overview":
         
         with col1:
             st.subheader("📈 Signups Over Time")
-            if 'created_at' in df.columns:
-                df['date'] = pd.to_datetime(df['created_at']).dt.date
-                daily_signups = df.groupby('date').size().reset_index(name='signups')
-                fig = px.line(
-                    daily_signups,
-                    x='date',
-                    y='signups',
-                    title="Daily Signups",
-                    markers=True
-                )
-                st.plotly_chart(fig, width='stretch')
+            signups_chart(agg['daily_signups'])
         
         with col2:
             st.subheader("🎯 Conversion Funnel")
-            funnel_data = {
-                'Stage': ['Signups', 'Active', 'Completed', 'Paid'],
-                'Count': [
-                    stats['total_users'],
-                    stats['active_challenges'],
-                    stats['completed_challenges'],
-                    stats['paid_users']
-                ]
-            }
-            fig = go.Figure(go.Funnel(
-                y=funnel_data['Stage'],
-                x=funnel_data['Count'],
-                textinfo="value+percent initial"
-            ))
-            fig.update_layout(title="User Journey Funnel")
-            st.plotly_chart(fig, width='stretch')
+            funnel_chart(stats)
         
         # Recent Activity
         st.markdown("---")
@@ -305,20 +710,14 @@ if page == "📊 Overview":
         
         with col1:
             st.markdown("**Latest Signups**")
-            # Convert created_at to datetime for sorting
-            df_sorted = df.copy()
-            df_sorted['created_at'] = pd.to_datetime(df_sorted['created_at'])
-            recent = df_sorted.nlargest(5, 'created_at')[['first_name', 'email', 'created_at', 'status']]
             for _, row in recent.iterrows():
-                status_emoji = status_color(row['status'])
-                st.text(f"{status_emoji} {row['first_name']} - {row['email']}")
+                st.text(f"{row['status_emoji']} {row['first_name']} - {row['email']}")
                 st.caption(f"Signed up: {row['created_at']}")
         
         with col2:
             st.markdown("**Users Completing Today**")
-            today_completers = df[(df['current_day'] == 8) & (df['status'] == 'challenge_running')]
             if not today_completers.empty:
-                for _, row in today_completers.head(5).iterrows():
+                for _, row in today_completers.iterrows():
                     st.text(f"🎉 {row['first_name']} - {row['email']}")
             else:
                 st.info("No users completing challenge today")
@@ -330,112 +729,50 @@ if page == "📊 Overview":
 elif page == "👥 Users":
     st.header("👥 User Management")
     
-    df = get_all_contacts()
+    agg = get_stats_agg()
     
-    if df.empty:
+    if agg['status_counts'].empty:
         st.warning("No contacts found in database.")
     else:
-        # Filters
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            status_filter = st.multiselect(
-                "Filter by Status",
-                options=df['status'].unique() if 'status' in df.columns else [],
-                default=df['status'].unique() if 'status' in df.columns else []
-            )
-        
-        with col2:
-            day_filter = st.multiselect(
-                "Filter by Day",
-                options=sorted(df['current_day'].unique()) if 'current_day' in df.columns else [],
-                default=sorted(df['current_day'].unique()) if 'current_day' in df.columns else []
-            )
-        
-        with col3:
-            search = st.text_input("🔍 Search by name/email/phone")
-        
-        # Apply filters
-        filtered_df = df.copy()
-        
-        if status_filter and 'status' in df.columns:
-            filtered_df = filtered_df[filtered_df['status'].isin(status_filter)]
+        # Filters - options come from the aggregates, rows are filtered server-side.
+        # Wrapped in a form so typing a search doesn't rerun the page on every keystroke.
+        with st.form('users_filters'):
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                status_options = agg['status_counts'].index.tolist()
+                status_filter = st.multiselect(
+                    "Filter by Status",
+                    options=status_options,
+                    default=status_options,
+                    format_func=lambda status: '(none)' if status is None else status
+                )
+            
+            with col2:
+                day_index = agg['day_counts'].index
+                day_options = sorted(int(day) for day in day_index.dropna())
+                if day_index.hasnans:
+                    day_options.append(None)
+                day_filter = st.multiselect(
+                    "Filter by Day",
+                    options=day_options,
+                    default=day_options,
+                    format_func=lambda day: '(none)' if day is None else day
+                )
+            
+            with col3:
+                search = st.text_input("🔍 Search by name/email/phone", help="'*' is ignored")
+            
+            # New filters start again from the first page
+            st.form_submit_button("Apply Filters", on_click=lambda: st.session_state.update(users_page=1))
         
-        if day_filter and 'current_day' in df.columns:
-            filtered_df = filtered_df[filtered_df['current_day'].isin(day_filter)]
+        # Selecting everything (or nothing) means no filter, so the query skips that column
+        if len(status_filter) == len(status_options):
+            status_filter = None
+        if len(day_filter) == len(day_options):
+            day_filter = None
         
-        if search:
-            mask = (
-                filtered_df['first_name'].str.contains(search, case=False, na=False) |
-                filtered_df['email'].str.contains(search, case=False, na=False) |
-                filtered_df['phone'].astype(str).str.contains(search, case=False, na=False)
-            )
-            filtered_df = filtered_df[mask]
-        
-        st.markdown(f"**Showing {len(filtered_df)} of {len(df)} users**")
-        
-        # Display users
-        for idx, row in filtered_df.iterrows():
-            with st.expander(f"{status_color(row['status'])} {row['first_name']} - {row['email']}"):
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.write("**Contact Info**")
-                    st.write(f"📧 Email: {row['email']}")
-                    st.write(f"📱 Phone: {row['phone']}")
-                    st.write(f"📅 Signed up: {row['created_at']}")
-                
-                with col2:
-                    st.write("**Challenge Progress**")
-                    st.write(f"📍 Current Day: {row['current_day']}")
-                    st.write(f"🎯 Status: {row['status']}")
-                    if 'consent_whatsapp' in row:
-                        st.write(f"💬 WhatsApp: {'✅' if row['consent_whatsapp'] else '❌'}")
-                    if 'consent_email' in row:
-                        st.write(f"📧 Email: {'✅' if row['consent_email'] else '❌'}")
-                
-                with col3:
-                    st.write("**Actions**")
-                    
-                    # Update Status
-                    new_status = st.selectbox(
-                        "Change Status",
-                        options=['lead_new', 'challenge_running', 'challenge_completed', 'paid_member'],
-                        index=['lead_new', 'challenge_running', 'challenge_completed', 'paid_member'].index(row['status']),
-                        key=f"status_{row['id']}"
-                    )
-                    
-                    # Update Day
-                    new_day = st.number_input(
-                        "Change Day",
-                        min_value=0,
-                        max_value=30,
-                        value=int(row['current_day']),
-                        key=f"day_{row['id']}"
-                    )
-                    
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        if st.button("💾 Save", key=f"save_{row['id']}"):
-                            updates = {
-                                'status': new_status,
-                                'current_day': new_day
-                            }
-                            update_contact(row['id'], updates)
-                            st.success("Updated!")
-                            st.cache_data.clear()
-                            st.rerun()
-                    
-                    with col_b:
-                        if st.button("🗑️ Delete", key=f"delete_{row['id']}"):
-                            if st.session_state.get(f'confirm_delete_{row["id"]}'):
-                                delete_contact(row['id'])
-                                st.success("Deleted!")
-                                st.cache_data.clear()
-                                st.rerun()
-                            else:
-                                st.session_state[f'confirm_delete_{row["id"]}'] = True
-                                st.warning("Click again to confirm")
+        render_users_table(status_filter, day_filter, search)
 
 # =====================================================
 # PAGE: ANALYTICS
@@ -444,79 +781,61 @@ elif page == "👥 Users":
 elif page == "📈 Analytics":
     st.header("📈 Analytics")
     
-    df = get_all_contacts()
+    # Date range selector
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input(
+            "Start Date",
+            value=datetime.now() - timedelta(days=30)
+        )
+    with col2:
+        end_date = st.date_input(
+            "End Date",
+            value=datetime.now()
+        )
+    
+    # Counted per day and status in Postgres, so no rows of the range are transferred
+    analytics = get_analytics_data(start_date, end_date)
+    status_daily = analytics['status_daily']
     
-    if df.empty:
-        st.warning("No contacts found in database.")
+    if status_daily.empty:
+        st.warning("No contacts found in this date range.")
     else:
-        # Date range selector
-        col1, col2 = st.columns(2)
+        # Metrics Row - one per-status sum covers every status metric
+        stats = get_stats(status_daily.groupby('status', dropna=False)['count'].sum())
+        
+        st.markdown(f"**Analyzing {stats['total_users']} users from {start_date} to {end_date}**")
+        st.markdown("---")
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
         with col1:
-            start_date = st.date_input(
-                "Start Date",
-                value=datetime.now() - timedelta(days=30)
-            )
+            st.metric("Total Signups", stats['total_users'])
+        
         with col2:
-            end_date = st.date_input(
-                "End Date",
-                value=datetime.now()
-            )
+            avg_day = analytics['avg_current_day'] or 0
+            st.metric("Avg Current Day", f"{avg_day:.1f}")
         
-        # Filter by date range
-        if 'created_at' in df.columns:
-            df['date'] = pd.to_datetime(df['created_at']).dt.date
-            mask = (df['date'] >= start_date) & (df['date'] <= end_date)
-            filtered_df = df[mask]
-            
-            st.markdown(f"**Analyzing {len(filtered_df)} users from {start_date} to {end_date}**")
-            st.markdown("---")
-            
-            # Metrics Row
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total Signups", len(filtered_df))
-            
-            with col2:
-                avg_day = filtered_df['current_day'].mean() if 'current_day' in filtered_df.columns else 0
-                st.metric("Avg Current Day", f"{avg_day:.1f}")
-            
-            with col3:
-                completion_rate = (len(filtered_df[filtered_df['status'] == 'challenge_completed']) / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
-                st.metric("Completion Rate", f"{completion_rate:.1f}%")
-            
-            with col4:
-                paid_rate = (len(filtered_df[filtered_df['status'] == 'paid_member']) / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
-                st.metric("Conversion Rate", f"{paid_rate:.1f}%")
-            
-            st.markdown("---")
-            
-            # Charts
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("📅 Daily Signups Trend")
-                daily = filtered_df.groupby('date').size().reset_index(name='count')
-                fig = px.area(
-                    daily,
-                    x='date',
-                    y='count',
-                    title="Signups per Day"
-                )
-                st.plotly_chart(fig, width='stretch')
-            
-            with col2:
-                st.subheader("🔄 Status Changes Over Time")
-                status_over_time = filtered_df.groupby(['date', 'status']).size().reset_index(name='count')
-                fig = px.line(
-                    status_over_time,
-                    x='date',
-                    y='count',
-                    color='status',
-                    title="Status Distribution Over Time"
-                )
-                st.plotly_chart(fig, width='stretch')
-            
+        with col3:
+            completion_rate = (stats['completed_challenges'] / stats['total_users'] * 100) if stats['total_users'] > 0 else 0
+            st.metric("Completion Rate", f"{completion_rate:.1f}%")
+        
+        with col4:
+            paid_rate = (stats['paid_users'] / stats['total_users'] * 100) if stats['total_users'] > 0 else 0
+            st.metric("Conversion Rate", f"{paid_rate:.1f}%")
+        
+        st.markdown("---")
+        
+        # Charts
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📅 Daily Signups Trend")
+            daily_trend_chart(status_daily)
+        
+        with col2:
+            st.subheader("🔄 Status Changes Over Time")
+            status_trend_chart(status_daily)
 
 # =====================================================
 # PAGE: SETTINGS
@@ -533,14 +852,17 @@ elif page == "⚙️ Settings":
     
     st.subheader("🔗 Supabase Connection")
     st.code(f"URL: {SUPABASE_URL}")
+    if get_cache_state()['live']:
+        st.write(f"**Realtime:** 🟢 Listening for changes (full refresh every {CONTACTS_LIVE_MAX_AGE}s)")
+    else:
+        st.write(f"**Realtime:** ⚪ Polling every {CONTACTS_MAX_AGE}s")
     st.info("⚠️ Update credentials in Streamlit Cloud secrets")
     
     st.markdown("---")
     
     st.subheader("📊 Database Info")
-    df = get_all_contacts()
-    st.write(f"**Total Records:** {len(df)}")
-    st.write(f"**Columns:** {', '.join(df.columns)}")
+    st.write(f"**Total Records:** {get_row_count()}")
+    st.write(f"**Columns:** {', '.join(CONTACT_COLUMNS.split(','))}")
     
     st.markdown("---")
     
@@ -550,15 +872,14 @@ elif page == "⚙️ Settings":
     
     with col1:
         if st.button("🗑️ Clear Cache"):
-            st.cache_data.clear()
+            clear_page_caches(get_cache_state())
             st.success("Cache cleared!")
     
     with col2:
-        if st.button("📥 Export All Data"):
-            csv = df.to_csv(index=False)
+        if st.button("📥 Export All Data", key="settings_export"):
             st.download_button(
                 label="Download CSV",
-                data=csv,
+                data=get_contacts_csv(),
                 file_name=f"nicole_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv"
             )
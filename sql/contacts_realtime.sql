@@ -0,0 +1,12 @@
+-- Publish contacts changes to Supabase Realtime, so the dashboard's listener
+-- (start_contacts_listener in main.py) receives an event for every insert, update and delete.
+do $$
+begin
+    if not exists (
+        select 1 from pg_publication_tables
+        where pubname = 'supabase_realtime' and schemaname = 'public' and tablename = 'contacts'
+    ) then
+        alter publication supabase_realtime add table public.contacts;
+    end if;
+end;
+$$;
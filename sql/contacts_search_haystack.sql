@@ -0,0 +1,12 @@
+-- Lowercased name/email/phone in one column, so the Users page search is a
+-- single LIKE over one trigram-indexed column instead of three ilike scans.
+create extension if not exists pg_trgm;
+
+alter table contacts
+    add column if not exists search_haystack text
+    generated always as (
+        lower(coalesce(first_name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(phone::text, ''))
+    ) stored;
+
+create index if not exists contacts_search_haystack_trgm
+    on contacts using gin (search_haystack gin_trgm_ops);
@@ -0,0 +1,26 @@
+-- Pre-aggregated contact counts for the Overview and Users pages.
+-- Returns a single jsonb object so PostgREST's max_rows limit can't truncate it:
+-- {"by_status": [{status, count}], "by_day": [{current_day, count}], "by_date": [{signup_date, count}]}
+-- Signup dates are UTC calendar days, whatever the session TimeZone is.
+-- The return type changed from a table, which create or replace can't do in place.
+drop function if exists dashboard_stats();
+create or replace function dashboard_stats()
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'by_status', (
+            select coalesce(jsonb_agg(s), '[]')
+            from (select status, count(*) as count from contacts group by 1) s
+        ),
+        'by_day', (
+            select coalesce(jsonb_agg(d), '[]')
+            from (select current_day, count(*) as count from contacts group by 1) d
+        ),
+        'by_date', (
+            select coalesce(jsonb_agg(t order by t.signup_date), '[]')
+            from (select (created_at at time zone 'utc')::date as signup_date, count(*) as count from contacts group by 1) t
+        )
+    );
+$$;
@@ -0,0 +1,26 @@
+-- Per-status signup counts for each day in [start_date, end_date], plus the average current_day
+-- of those contacts, for the Analytics page.
+-- Days are UTC calendar days, matching the date inputs, whatever the session TimeZone is.
+-- Returns a single jsonb object so PostgREST's max_rows limit can't truncate long ranges:
+-- {"by_date": [{date, status, count}], "avg_current_day": number or null}
+-- The return type changed from a table, which create or replace can't do in place.
+drop function if exists status_daily(date, date);
+create or replace function status_daily(start_date date, end_date date)
+returns jsonb
+language sql
+stable
+as $$
+    with in_range as (
+        select (created_at at time zone 'utc')::date as date, status, current_day
+        from contacts
+        where created_at >= (start_date::timestamp at time zone 'utc')
+          and created_at < ((end_date + 1)::timestamp at time zone 'utc')
+    )
+    select jsonb_build_object(
+        'by_date', (
+            select coalesce(jsonb_agg(d order by d.date, d.status), '[]')
+            from (select date, status, count(*) as count from in_range group by 1, 2) d
+        ),
+        'avg_current_day', (select avg(current_day) from in_range)
+    );
+$$;